@@ -1,53 +1,6 @@
 import streamlit as st
-import numpy as np
-import plotly.graph_objects as go
-from scipy.ndimage import gaussian_filter
-import time # To simulate work if needed
 
-# --- Heatmap Generation Logic (Your Code Encapsulated) ---
-# --- Heatmap Generation Logic (Your Code Encapsulated) ---
-def generate_heatmap():
-    """Generates the plaster thickness heatmap."""
-    # Define wall dimensions (10m x 10m)
-    wall_width = 10  # meters
-    wall_height = 10  # meters
-
-    # Increase grid resolution
-    grid_points = 100
-    x = np.linspace(0, wall_width, grid_points)
-    y = np.linspace(0, wall_height, grid_points)
-
-    # Generate synthetic data
-    X, Y = np.meshgrid(x, y)
-    # Make data generation slightly more interesting/variable each run
-    noise_level = np.random.uniform(0.3, 0.8)
-    base_pattern = np.sin(X * np.random.uniform(0.5,1.5)) + np.cos(Y * np.random.uniform(0.5,1.5))
-    data = base_pattern + np.random.rand(grid_points, grid_points) * noise_level
-
-    # Smooth the data
-    smoothed_data = gaussian_filter(data, sigma=2)
-
-    # Create heatmap figure object
-    fig = go.Figure(go.Heatmap(
-        z=smoothed_data,
-        x=x,
-        y=y,
-        colorscale="Viridis",
-        colorbar=dict(title="Thickness (mm)") # Assuming mm, adjust if needed
-    ))
-
-    fig.update_layout(
-        title="Wall Plastering Heatmap (10m x 10m)", # Title specific to the plot
-        xaxis=dict(title="Width (m)", range=[0, 10], dtick=1),
-        yaxis=dict(title="Height (m)", range=[0, 10], dtick=1),
-        # ----- CHANGES HERE -----
-        height=700,  # Increased height in pixels (adjust as needed)
-        # width=700, # You can uncomment this to force width too, but often letting Streamlit handle width is better
-        yaxis_scaleanchor='x', # Make y-axis scale match x-axis scale for a square plot
-        # ----- END CHANGES -----
-        margin=dict(l=20, r=20, t=40, b=20) # Adjust margins if needed
-    )
-    return fig
+from plastermate_core import generate_heatmap
 
 # --- Streamlit App UI ---
 
@@ -74,8 +27,6 @@ output_area = st.container() # Create a container for the output
 if run_button:
     with output_area:
         with st.spinner("Generating heatmap... Please wait."):
-            # Simulate some work if generation is very fast
-            # time.sleep(1)
             try:
                 fig = generate_heatmap()
                 st.plotly_chart(fig, use_container_width=True) # Display the Plotly chart
@@ -0,0 +1,413 @@
+"""Shared core for the Plastermate Streamlit entrypoints.
+
+The heatmap generation pipelines, cached grids/kernels/layout templates,
+session-state setup, and saved-scan helpers live here so each UI script
+stays a thin page definition and every entrypoint shares a single parsed
+and warmed copy of the heavy numeric machinery.
+"""
+import streamlit as st
+import numpy as np
+import plotly.graph_objects as go
+from scipy.ndimage import convolve1d
+import time
+import re
+import io # Needed to read the uploaded file content
+
+
+# --- Session State Initialization ---
+def init_session_state():
+    """Seed st.session_state with the keys the apps rely on."""
+    for key, default in {
+        "saved_scans": {},
+        "scan_counter": 1,
+        "latest_run_figure": None,
+        "view_mode": "none",      # "none", "latest", "saved"
+        "selected_saved_scan_name": None,
+        "just_saved": False,      # Flag to show success header
+        "uploaded_file_state": None # To track the uploaded file
+    }.items():
+        if key not in st.session_state:
+            st.session_state[key] = default
+
+
+# --- Shared figure layouts ---
+# update_layout re-validates every field against Plotly's schema on each
+# call. The layouts never change between runs, so validate them once at
+# import and hand the templates to each figure; only the title ever changes
+# per figure.
+_LIDAR_LAYOUT = go.Layout(
+    title='Wall Defect Map (Processed LiDAR Data)',
+    # Fixed ranges for a 4m wide (-2 to 2) and 2m high (0 to 2) wall,
+    # 1:1 aspect ratio
+    xaxis=dict(title='Horizontal (m)', range=[-2.2, 2.2], scaleanchor='y', scaleratio=1),
+    yaxis=dict(title='Height (m)',     range=[0, 2.2], scaleanchor='x', scaleratio=1),
+    height=700,
+    margin=dict(l=20, r=20, t=50, b=20)
+)
+
+_THICKNESS_LAYOUT = go.Layout(
+    title="Wall Plastering Heatmap (10m x 10m)", # Title specific to the plot
+    xaxis=dict(title="Width (m)", range=[0, 10], dtick=1),
+    yaxis=dict(title="Height (m)", range=[0, 10], dtick=1),
+    height=700,  # Increased height in pixels (adjust as needed)
+    yaxis_scaleanchor='x', # Make y-axis scale match x-axis scale for a square plot
+    margin=dict(l=20, r=20, t=40, b=20) # Adjust margins if needed
+)
+
+
+# --- Gaussian smoothing kernels ---
+# The smoothing is 2-D with fixed sigmas, so precompute truncated 1-D
+# kernels once and apply them along each axis with convolve1d instead of
+# going through scipy's generic n-D gaussian_filter machinery. Radius
+# matches gaussian_filter's default truncation (4*sigma), so the output is
+# identical to within float32 rounding.
+def _gaussian_kernel1d(sigma, radius):
+    x = np.arange(-radius, radius + 1)
+    k = np.exp(-0.5 * (x / sigma) ** 2)
+    return (k / k.sum()).astype(np.float32)
+
+_LIDAR_SMOOTH_KERNEL = _gaussian_kernel1d(sigma=3.0, radius=12)
+_THICKNESS_SMOOTH_KERNEL = _gaussian_kernel1d(sigma=2.0, radius=8)
+
+
+# --- Synthetic thickness heatmap grid ---
+# Wall dimensions (10m x 10m) and grid resolution are constants, so build
+# the sampling grid once at import time instead of on every button click.
+# The scratch buffers let the pattern/noise math below run in place.
+_WALL_WIDTH = 10   # meters
+_WALL_HEIGHT = 10  # meters
+_GRID_POINTS = 100
+_x = np.linspace(0, _WALL_WIDTH, _GRID_POINTS)
+_y = np.linspace(0, _WALL_HEIGHT, _GRID_POINTS)
+_X, _Y = np.meshgrid(_x, _y)
+_pattern_buf = np.empty_like(_X)
+_noise_buf = np.empty_like(_X)
+
+# Single PCG64 generator shared across runs — faster than the legacy global
+# Mersenne Twister and able to fill the cached noise buffer in place.
+_rng = np.random.default_rng()
+
+
+# --- Optional Numba acceleration ---
+# When numba is installed, the geometry -> deviation -> binning stages run as
+# one fused, parallel pass over the points instead of several whole-array
+# NumPy traversals with intermediate allocations. The NumPy code below stays
+# as the fallback when numba is missing.
+try:
+    from numba import njit, prange, get_num_threads, get_thread_id
+except ImportError:
+    njit = None
+
+if njit is not None:
+    # Note: no cache=True here — Streamlit executes app scripts via exec(),
+    # where numba's on-disk cache records a module name it cannot re-import.
+    @njit
+    def _level_baselines(levels, dists, max_lvl):
+        """Minimum distance per level, indexed by raw level number."""
+        base = np.full(max_lvl + 1, np.inf)
+        for i in range(levels.size):
+            if dists[i] < base[levels[i]]:
+                base[levels[i]] = dists[i]
+        return base
+
+    @njit(parallel=True, fastmath=True)
+    def _bin_points(levels, azimuths, dists, base, x0, x1, z0, z1, nx, nz):
+        """Fused polar->Cartesian, deviation, and 2D binning kernel.
+
+        Each thread accumulates into its own partial histogram; the partials
+        are reduced at the end, so no atomics are needed in the hot loop.
+        """
+        deg = np.pi / 180.0
+        inv_dx = nx / (x1 - x0)
+        inv_dz = nz / (z1 - z0)
+        nthreads = get_num_threads()
+        sums = np.zeros((nthreads, nx, nz))
+        counts = np.zeros((nthreads, nx, nz))
+        for i in prange(levels.size):
+            t = get_thread_id()
+            theta_e = (levels[i] - 1) * 1.8 * deg
+            theta_a = azimuths[i] * deg
+            x = dists[i] * np.cos(theta_e) * np.sin(theta_a) / 1000.0
+            z = dists[i] * np.sin(theta_e) / 1000.0
+            if x < x0 or x > x1 or z < z0 or z > z1:
+                continue
+            ix = min(int((x - x0) * inv_dx), nx - 1)
+            iz = min(int((z - z0) * inv_dz), nz - 1)
+            sums[t, ix, iz] += dists[i] - base[levels[i]]
+            counts[t, ix, iz] += 1.0
+        return sums.sum(axis=0), counts.sum(axis=0)
+
+    # Warm the JIT once at import so the first real analysis doesn't pay
+    # compilation latency.
+    _warm = np.array([1], dtype=np.int32)
+    _bin_points(_warm, np.zeros(1), np.ones(1), _level_baselines(_warm, np.ones(1), 1),
+                -2.2, 2.2, 0.0, 2.2, 4, 4)
+
+
+# --- LiDAR Data Processing and Heatmap Generation ---
+# Memoized on the file content, so re-running "New Analysis" on the same
+# upload returns the cached figure instead of redoing parse/geometry/smooth.
+@st.cache_data(max_entries=8, show_spinner=False)
+def process_lidar_data_and_generate_heatmap(file_content):
+    """
+    Processes LiDAR data from an uploaded file and generates a Plotly heatmap
+    with fixed ranges and a 1:1 aspect ratio for a 2m high x 4m wide wall.
+
+    Args:
+        file_content (bytes or str): The content of the uploaded LiDAR data
+                                     file, as stored by the uploader.
+
+    Returns:
+        plotly.graph_objects.Figure or None: The generated heatmap figure,
+                                             or None if an error occurs.
+    """
+    try:
+        # Uploads are kept as raw bytes in session state; decode exactly once
+        if isinstance(file_content, bytes):
+            file_content = file_content.decode("utf-8")
+        # 1) Split the buffer on 'Level N' headers and hand each block to
+        #    np.loadtxt, so tokenizing happens in C instead of line-by-line
+        #    Python string handling.
+        blocks = re.split(r'^Level\s+(\d+)\s*$', file_content, flags=re.M)
+        if blocks[0].strip():
+            st.warning(f"Skipping data before first 'Level' declaration: '{blocks[0].strip().splitlines()[0]}'")
+
+        bodies, lvl_ids = [], []
+        for lvl_str, body in zip(blocks[1::2], blocks[2::2]):
+            if body.strip():
+                bodies.append(body)
+                lvl_ids.append(int(lvl_str))
+
+        if not bodies: # Check if any data was actually parsed
+            st.error("No valid data points found in the file.")
+            return None
+
+        # Tokenize all blocks in a single np.loadtxt call and rebuild the
+        # level column afterwards from the per-block data-line counts (each
+        # data line carries exactly one comma). One pass through numpy's C
+        # tokenizer beats one call per level block.
+        counts = np.array([body.count(',') for body in bodies])
+        try:
+            arr = np.loadtxt(io.StringIO(''.join(bodies)), delimiter=',', dtype=np.float64, ndmin=2)
+        except ValueError:
+            st.error("Error parsing data lines. Expected '<azimuth>,<distance>' per line.")
+            return None
+        if arr.shape[1] != 2 or arr.shape[0] != counts.sum():
+            st.error("Error parsing data lines. Expected '<azimuth>,<distance>' per line.")
+            return None
+
+        levels = np.repeat(np.array(lvl_ids, dtype=np.int32), counts)
+        azimuths = arr[:, 0]
+        dists = arr[:, 1]
+
+        # 2-4) Convert polar (r, elev, azimuth) -> Cartesian (X, Z), compute
+        #      per-level baseline deviations, and bin into a 2D grid
+        #      (horizontal X vs. vertical Z).
+        #      Motor elevation per level = (level-1)*1.8 degrees.
+        nx, nz = 200, 200
+        # Use fixed ranges for a 4m wide (-2 to 2) and 2m high (0 to 2) wall
+        xb = np.linspace(-2.2, 2.2, nx + 1) # Added slight padding
+        zb = np.linspace(0, 2.2, nz + 1)  # Added slight padding
+
+        if njit is not None:
+            # Fused Numba kernel: trig, deviation, bin index and accumulation
+            # in one parallel pass with no intermediate arrays.
+            base = _level_baselines(levels, dists, int(levels.max()))
+            H_sum, H_count = _bin_points(levels, azimuths, dists, base,
+                                         xb[0], xb[-1], zb[0], zb[-1], nx, nz)
+        else:
+            theta_e = np.deg2rad((levels - 1) * 1.8)  # motor tilt: 0, 1.8, 3.6, ...
+            theta_a = np.deg2rad(azimuths)            # lidar scan angle
+
+            # True offsets in mm, converted to meters
+            X = dists * np.cos(theta_e) * np.sin(theta_a) / 1000.0
+            Z = dists * np.sin(theta_e) / 1000.0
+
+            # Minimum distance per level is the "flat wall" reference; the
+            # deviation of each point is its distance minus that baseline.
+            # Levels are small integers, so index a dense array by raw level
+            # number directly — same layout as the Numba kernel above — and
+            # skip the np.unique sort entirely.
+            base = np.full(int(levels.max()) + 1, np.inf)
+            np.minimum.at(base, levels, dists)
+            D = dists - base[levels]
+
+            # The bins are uniform, so compute integer bin indices directly
+            # and accumulate sums and counts with bincount -- one pass over
+            # the points per accumulator instead of two histogram2d calls.
+            in_range = (X >= xb[0]) & (X <= xb[-1]) & (Z >= zb[0]) & (Z <= zb[-1])
+            ix = np.minimum(((X[in_range] - xb[0]) / (xb[1] - xb[0])).astype(np.intp), nx - 1)
+            iz = np.minimum(((Z[in_range] - zb[0]) / (zb[1] - zb[0])).astype(np.intp), nz - 1)
+            flat = ix * nz + iz
+            H_count = np.bincount(flat, minlength=nx * nz).reshape(nx, nz)
+            H_sum = np.bincount(flat, weights=D[in_range], minlength=nx * nz).reshape(nx, nz)
+
+        # Average deviation per bin; bins with no points stay at 0. The
+        # output starts uninitialized — every element is written either by
+        # the masked divide or by the fill below — so np.zeros' memset pass
+        # is skipped.
+        occupied = H_count > 0
+        H_filled = np.empty_like(H_sum)
+        np.divide(H_sum, H_count, out=H_filled, where=occupied)
+        H_filled[~occupied] = 0.0
+
+        # 5) Gaussian-smooth. Smoothing is memory-bound, so run it in float32
+        #    as two separable 1-D passes with a preallocated output.
+        H_filled = H_filled.astype(np.float32, copy=False)
+        H_smooth = np.empty_like(H_filled)
+        convolve1d(H_filled, _LIDAR_SMOOTH_KERNEL, axis=0, output=H_smooth, mode='reflect')
+        convolve1d(H_smooth, _LIDAR_SMOOTH_KERNEL, axis=1, output=H_smooth, mode='reflect')
+
+        # 6) Downsample 2x for the wire payload. After sigma=3 smoothing the
+        #    grid carries no detail finer than this, and the smaller float32
+        #    array shrinks the JSON Streamlit re-serializes on every rerun.
+        ds = 2
+        H_out = H_smooth.reshape(nx // ds, ds, nz // ds, ds).mean(axis=(1, 3))
+
+        # 7) Plot as a heatmap of deviation
+        xc = ((xb[:-1] + xb[1:]) / 2).reshape(-1, ds).mean(axis=1)
+        zc = ((zb[:-1] + zb[1:]) / 2).reshape(-1, ds).mean(axis=1)
+
+        fig = go.Figure(go.Heatmap(
+            z=H_out.T,   # Transpose because the bin grid is (X, Z) but heatmap expects (row=Y, col=X)
+            x=xc,
+            y=zc,
+            colorscale='rainbow', # Or 'Viridis' etc.
+            zmid=0, # Center colorscale at 0 deviation
+            colorbar=dict(title='Deflection (mm)')
+        ), layout=_LIDAR_LAYOUT)
+        return fig
+
+    except Exception as e:
+        st.error(f"An unexpected error occurred during processing: {e}")
+        import traceback
+        st.error(traceback.format_exc()) # Show detailed error in Streamlit for debugging
+        return None
+
+
+# --- Synthetic Thickness Heatmap Generation ---
+def generate_heatmap():
+    """Generates the plaster thickness heatmap."""
+    # Generate synthetic data on the cached grid
+    # Make data generation slightly more interesting/variable each run
+    noise_level = _rng.uniform(0.3, 0.8)
+    np.sin(_X * _rng.uniform(0.5, 1.5), out=_pattern_buf)
+    np.add(_pattern_buf, np.cos(_Y * _rng.uniform(0.5, 1.5)), out=_pattern_buf)
+    _rng.random(out=_noise_buf)
+    np.multiply(_noise_buf, noise_level, out=_noise_buf)
+    np.add(_pattern_buf, _noise_buf, out=_pattern_buf)
+
+    # Smooth the data. The filter is memory-bound, so run it in float32 as
+    # two separable 1-D passes with a preallocated output.
+    data = _pattern_buf.astype(np.float32)
+    smoothed_data = np.empty_like(data)
+    convolve1d(data, _THICKNESS_SMOOTH_KERNEL, axis=0, output=smoothed_data, mode='reflect')
+    convolve1d(smoothed_data, _THICKNESS_SMOOTH_KERNEL, axis=1, output=smoothed_data, mode='reflect')
+
+    # Create heatmap figure object
+    fig = go.Figure(go.Heatmap(
+        z=smoothed_data,
+        x=_x,
+        y=_y,
+        colorscale="Viridis",
+        colorbar=dict(title="Thickness (mm)") # Assuming mm, adjust if needed
+    ), layout=_THICKNESS_LAYOUT)
+    return fig
+
+
+# --- Saved Scan Packing ---
+# A live go.Figure carries the full-resolution z grid as nested Python data
+# plus the whole layout tree — hundreds of KB that Streamlit re-serializes on
+# every rerun. Saved scans therefore store just the arrays and the title, and
+# the figure is rebuilt on demand when viewed. The z grid is quantized to
+# uint8 against its own min/max: after smoothing, 256 steps is finer than
+# what the colormap can display, and it is 8x smaller than float64.
+def pack_figure(fig):
+    """Compact session-state representation of a heatmap figure."""
+    hm = fig.data[0]
+    z = np.asarray(hm.z, dtype=np.float32)
+    zmin = float(z.min())
+    zmax = float(z.max())
+    scale = (zmax - zmin) or 1.0  # avoid 0/0 on a flat wall
+    return {
+        "q": ((z - zmin) * (255.0 / scale) + 0.5).astype(np.uint8),  # round, don't truncate
+        "zmin": zmin,
+        "zmax": zmax,
+        "x": np.asarray(hm.x),
+        "y": np.asarray(hm.y),
+        "title": fig.layout.title.text,
+    }
+
+@st.cache_resource(show_spinner=False)
+def _view_figure():
+    """One reusable figure for the saved-scan view, built once per process.
+
+    Switching between saved scans only swaps the trace arrays and title on
+    this figure instead of constructing and validating a fresh go.Figure,
+    which lets Plotly restyle incrementally on the client.
+    """
+    return go.Figure(go.Heatmap(
+        z=[[0.0]],
+        colorscale='rainbow',
+        zmid=0,
+        colorbar=dict(title='Deflection (mm)')
+    ), layout=_LIDAR_LAYOUT)
+
+def unpack_figure(packed):
+    """Render a packed scan onto the shared view figure (mutated in place)."""
+    fig = _view_figure()
+    hm = fig.data[0]
+    hm.z = packed["q"].astype(np.float32) * ((packed["zmax"] - packed["zmin"]) / 255.0) + packed["zmin"]
+    hm.x = packed["x"]
+    hm.y = packed["y"]
+    fig.layout.title.text = packed["title"]
+    return fig
+
+
+# --- Callback: Select Saved Scan ---
+def on_select_saved():
+    sel = st.session_state.get("saved_scan_selectbox", "")
+    if sel in st.session_state.saved_scans:
+        st.session_state.selected_saved_scan_name = sel
+        st.session_state.view_mode = "saved"
+        st.session_state.latest_run_figure = None
+    else:
+        st.session_state.selected_saved_scan_name = None
+        st.session_state.view_mode = "none"
+
+
+# --- Sidebar: Saved Scans Section ---
+def sidebar_saved_scans():
+    """Render the saved-scans selectbox and delete button in the sidebar."""
+    if st.session_state.saved_scans:
+        names = list(st.session_state.saved_scans.keys())
+        options = [""] + names # Add empty option for clearing selection
+        # Find current index, default to 0 if not selected or not found
+        try:
+            idx = names.index(st.session_state.selected_saved_scan_name) + 1
+        except (ValueError, TypeError):
+            idx = 0
+
+        st.selectbox(
+            "Select a saved scan:",
+            options,
+            index=idx,
+            key="saved_scan_selectbox",
+            on_change=on_select_saved,
+            format_func=lambda v: "Choose a scan..." if v == "" else v,
+            help="Select a previously saved scan to view or delete."
+           )
+
+        if st.session_state.selected_saved_scan_name:
+            if st.button(f"Delete '{st.session_state.selected_saved_scan_name}'", use_container_width=True): # Removed emoji
+                del st.session_state.saved_scans[st.session_state.selected_saved_scan_name]
+                st.snow()
+                time.sleep(0.5) # Give time for animation
+                st.success("Scan deleted.")
+                # Reset view after deletion
+                st.session_state.view_mode = "none"
+                st.session_state.selected_saved_scan_name = None
+                st.session_state.latest_run_figure = None # Clear latest figure too
+                st.rerun() # Rerun to update selectbox and view
+    else:
+        st.info("No saved scans yet.")